@@ -1,19 +1,34 @@
 import os
-import json
+import sys
+import logging
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
 import re
+import functools
+
+import orjson
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick not installed, fall back to regex scans
+    ahocorasick = None
 
 # ========== STATUS LIFECYCLE ==========
 # needs_review → classified → organized
 # This ensures proper workflow tracking and audit trail
 # =======================================
 
-# Create metadata folder if it doesn't exist
-os.makedirs("metadata", exist_ok=True)
+logger = logging.getLogger(__name__)
 
 # Get today's date
 today = date.today().isoformat()
 
+# Classification signals sit in the title/intro, so detectors only scan this many leading chars
+DETECTION_WINDOW = 4000
+
+# Insurer names only count on the cover page
+INSURER_WINDOW = 2000
+
 # PHASE 2.5: Known Insurer Dictionary (NZ, AU, UK)
 KNOWN_INSURERS = [
     'AMI',
@@ -40,98 +55,183 @@ KNOWN_INSURERS = [
 ]
 
 # PHASE 2.5: Safe Text Cleaning Function
+_CLEAN_RE = re.compile(r'[^A-Za-z0-9_-]')
+
 def clean_text(value):
     """
     Safe text cleaning for filenames and folder names
     """
     if not value:
         return "Unknown"
-    value = str(value).strip()
+    # Convert first so any JSON value (lists included) can hit the cache
+    return _clean_str(str(value))
+
+@functools.lru_cache(maxsize=4096)
+def _clean_str(value):
+    """Cached cleaning of an already-stringified value"""
+    value = value.strip()
     value = value.replace(' ', '_')
-    value = re.sub(r'[^A-Za-z0-9_-]', '', value)
+    value = _CLEAN_RE.sub('', value)
     return value if value else "Unknown"
 
-# ===== FIX 1: INSURER DETECTION (TOP OF DOCUMENT ONLY) =====
-def detect_insurer(text):
+# Insurance line keywords in priority order (most specific first)
+LINE_KEYWORDS = [
+    ("Professional Indemnity", ["professional indemnity", "pi insurance", "professional liability", "accountants liability"]),
+    ("Farm", ["farm insurance", "agricultural", "farming", "rural property"]),
+    ("Landlord", ["landlord", "rental property", "investment property", "residential landlord"]),
+    ("Construction", ["construction", "builders indemnity", "contract works", "building project"]),
+    ("Motor", ["car insurance", "motor", "vehicle insurance", "auto insurance"]),
+    ("Life", ["life insurance", "life cover", "life protection"]),
+    ("Health", ["health insurance", "medical insurance", "health cover"]),
+    ("Home & Contents", ["home insurance", "contents insurance", "house insurance", "home & contents"]),
+    ("Travel", ["travel insurance", "trip insurance", "travel cover"]),
+]
+
+# Country keywords in priority order
+COUNTRY_KEYWORDS = [
+    ("New Zealand", ["new zealand", "nz ", " nz", "auckland", "wellington"]),
+    ("Australia", ["australia", " au ", "sydney", "melbourne"]),
+    ("United Kingdom", ["united kingdom", "uk ", " uk", "england", "scotland"]),
+]
+
+# ===== KEYWORD INDEX (keyword -> detector tags, built once at import) =====
+def build_keyword_index():
     """
-    Only check first 2000 chars (cover page).
-    Prevents legal fine-print from hijacking classification.
+    Map every lowercased keyword to the (category, label, priority) tags it
+    signals, so all detectors share one keyword table.
+    Lower priority wins; a repeated keyword keeps its best tag per category.
     """
-    first_section = text[:2000].upper()
-    
-    for insurer in KNOWN_INSURERS:
-        if insurer.upper() in first_section:
-            return insurer
-    
+    index = {}
+    detectors = [
+        ("insurer", [(insurer, [insurer]) for insurer in KNOWN_INSURERS]),
+        ("insurance_line", LINE_KEYWORDS),
+        ("country", COUNTRY_KEYWORDS),
+    ]
+    for category, keywords in detectors:
+        for priority, (label, words) in enumerate(keywords):
+            for word in words:
+                tags = index.setdefault(word.lower(), [])
+                if not any(tag[0] == category for tag in tags):
+                    tags.append((category, label, priority))
+    return {word: tuple(tags) for word, tags in index.items()}
+
+KEYWORD_INDEX = build_keyword_index()
+
+# ===== KEYWORD AUTOMATON (built once at import) =====
+def build_automaton():
+    """
+    Build one Aho-Corasick automaton over every KEYWORD_INDEX entry.
+    Each keyword maps to its tuple of (category, label, priority) tags.
+    """
+    automaton = ahocorasick.Automaton()
+    for word, tags in KEYWORD_INDEX.items():
+        automaton.add_word(word, tags)
+    automaton.make_automaton()
+    return automaton
+
+# ===== REGEX FALLBACK (used when pyahocorasick is unavailable) =====
+def build_patterns(keywords):
+    """
+    Compile one alternation regex per label, kept in priority order.
+    """
+    return [
+        (re.compile('|'.join(re.escape(word.lower()) for word in words)), label)
+        for label, words in keywords
+    ]
+
+def first_pattern_match(patterns, text):
+    """
+    Return the label of the first pattern (by priority) found in text.
+    """
+    for pattern, label in patterns:
+        if pattern.search(text):
+            return label
     return "Unknown"
 
-# ===== FIX 2: IMPROVED INSURANCE LINE DETECTION =====
-def detect_line(text):
+def first_insurer_match(text):
     """
-    Selective line detection with priority order.
-    Checks most specific types first.
+    Single regex pass for insurers, preserving KNOWN_INSURERS priority.
+    The lookahead reports a hit at every position, so overlapping names are not missed.
     """
-    t = text.lower()
-    
-    # Check in priority order (most specific first)
-    if any(word in t for word in ["professional indemnity", "pi insurance", "professional liability", "accountants liability"]):
-        return "Professional Indemnity"
-    
-    if any(word in t for word in ["farm insurance", "agricultural", "farming", "rural property"]):
-        return "Farm"
-    
-    if any(word in t for word in ["landlord", "rental property", "investment property", "residential landlord"]):
-        return "Landlord"
-    
-    if any(word in t for word in ["construction", "builders indemnity", "contract works", "building project"]):
-        return "Construction"
-    
-    if any(word in t for word in ["car insurance", "motor", "vehicle insurance", "auto insurance"]):
-        return "Motor"
-    
-    if any(word in t for word in ["life insurance", "life cover", "life protection"]):
-        return "Life"
-    
-    if any(word in t for word in ["health insurance", "medical insurance", "health cover"]):
-        return "Health"
-    
-    if any(word in t for word in ["home insurance", "contents insurance", "house insurance", "home & contents"]):
-        return "Home & Contents"
+    best = None
+    for match in INSURER_PATTERN.finditer(text):
+        index = int(match.lastgroup[1:])
+        if best is None or index < best:
+            best = index
+            if index == 0:
+                break
+    return "Unknown" if best is None else KNOWN_INSURERS[best]
+
+if ahocorasick is not None:
+    # Rebuilt per run on purpose: building takes ~40us, the same as unpickling a cached copy
+    AHO_ALL = build_automaton()
+else:
+    INSURER_PATTERN = re.compile('(?=' + '|'.join(
+        f'(?P<i{index}>{re.escape(insurer.lower())})'
+        for index, insurer in enumerate(KNOWN_INSURERS)
+    ) + ')')
+    LINE_PATTERNS = build_patterns(LINE_KEYWORDS)
+    COUNTRY_PATTERNS = build_patterns(COUNTRY_KEYWORDS)
+
+# ===== FIX 1 + FIX 2: SINGLE-PASS KEYWORD DETECTION =====
+def detect_keywords(text):
+    """
+    One pass over lowercased text, keeping the highest-priority country,
+    insurer and insurance line (most specific types win).
+    Insurer hits only count inside the first INSURER_WINDOW chars (cover page),
+    so legal fine-print cannot hijack classification.
+    """
+    if ahocorasick is None:
+        return {
+            "country": first_pattern_match(COUNTRY_PATTERNS, text),
+            "insurer": first_insurer_match(text[:INSURER_WINDOW]),
+            "insurance_line": first_pattern_match(LINE_PATTERNS, text),
+        }
     
-    if any(word in t for word in ["travel insurance", "trip insurance", "travel cover"]):
-        return "Travel"
+    best = {"country": (None, "Unknown"), "insurer": (None, "Unknown"), "insurance_line": (None, "Unknown")}
+    settled = 0  # Categories already holding their top-priority label
+    for end_index, tags in AHO_ALL.iter(text):
+        for category, label, priority in tags:
+            if category == "insurer" and end_index >= INSURER_WINDOW:
+                continue
+            best_priority = best[category][0]
+            if best_priority is None or priority < best_priority:
+                best[category] = (priority, label)
+                if priority == 0:
+                    settled += 1
+        if settled == len(best):
+            break  # Nothing left to improve, skip the rest of the window
     
-    return "Unknown"
+    return {category: label for category, (_, label) in best.items()}
 
 # ===== FIX 3: PRODUCT NAME FROM TITLE TEXT =====
+_PRODUCT_RE = re.compile(r'policy|insurance|wording|cover', re.IGNORECASE)
+
 def detect_product_name(text):
     """
     Extract product name from title-like text in top 30 lines.
     Looks for lines that contain policy-related keywords.
     """
-    lines = text.split('\n')[:30]  # Top of document only
+    # Top of document only; maxsplit avoids splitting the rest of the text
+    lines = text.split('\n', 30)[:30]
     
     for line in lines:
         trimmed = line.strip()
-        # Look for title-like text: reasonable length, contains insurance keywords
-        if 10 < len(trimmed) < 100 and not trimmed.startswith('www'):
-            if any(keyword in trimmed.lower() for keyword in ['policy', 'insurance', 'wording', 'cover']):
+        # Look for title-like text: reasonable length, not a URL, contains insurance keywords
+        if 10 < len(trimmed) < 100 and not trimmed.startswith(('www', 'http')):
+            if _PRODUCT_RE.search(trimmed):
                 return trimmed
     
     return "General Policy"
 
-def detect_country(text):
-    """Detect country from text"""
-    t = text.lower()
-    
-    if any(word in t for word in ["new zealand", "nz ", " nz", "auckland", "wellington"]):
-        return "New Zealand"
-    if any(word in t for word in ["australia", " au ", "sydney", "melbourne"]):
-        return "Australia"
-    if any(word in t for word in ["united kingdom", "uk ", " uk", "england", "scotland"]):
-        return "United Kingdom"
-    
-    return "Unknown"
+def classify(text):
+    """
+    Fused detection for one document: a single keyword pass over the
+    lowercased detection window, plus the title scan for the product name.
+    """
+    result = detect_keywords(text[:DETECTION_WINDOW].lower())
+    result["product_name"] = detect_product_name(text)
+    return result
 
 def build_filename(meta):
     """
@@ -144,110 +244,212 @@ def build_filename(meta):
     
     return f"{country}_{insurer}_{line}_{product}.pdf"
 
+def write_json(filepath, data):
+    """
+    Serialize data with orjson and write the bytes straight to a file descriptor
+    """
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def read_legacy_records(folder):
+    """
+    Read legacy one-JSON-file-per-PDF metadata as JSONL lines keyed by original_filename,
+    so reviewed statuses carry over into metadata.jsonl.
+    """
+    records = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith('.json') or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    metadata = orjson.loads(f.read())
+                key = metadata.get("original_filename")
+            except (OSError, orjson.JSONDecodeError, AttributeError) as e:
+                logger.warning("⚠️  Legacy metadata %s not migrated: %s", entry.name, e)
+                continue
+            if not key:
+                logger.warning("⚠️  Legacy metadata %s not migrated: missing original_filename", entry.name)
+                continue
+            records[key] = orjson.dumps(metadata) + b"\n"
+    if records:
+        logger.info("📦 Migrating %d legacy metadata files into %s\n", len(records), os.path.basename(METADATA_JSONL))
+    return records
+
+def read_jsonl_records(filepath):
+    """
+    Read existing JSONL metadata as raw lines keyed by original_filename.
+    Lines that cannot be parsed are kept as-is under a placeholder key.
+    On the first JSONL run, records are seeded from legacy per-file JSON instead.
+    """
+    records = {}
+    if not os.path.exists(filepath):
+        return read_legacy_records(os.path.dirname(filepath))
+    with open(filepath, 'rb') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                key = orjson.loads(line).get("original_filename")
+            except (orjson.JSONDecodeError, AttributeError):
+                key = None
+            records[key or ("unparsed", line_number)] = line if line.endswith(b"\n") else line + b"\n"
+    return records
+
 # Scan raw_documents folder
 raw_docs_folder = "raw_documents"
 
-if not os.path.exists(raw_docs_folder):
-    print(f"Error: {raw_docs_folder} folder not found")
-else:
-    file_count = 0
+# All metadata records, one JSON object per line
+METADATA_JSONL = os.path.join("metadata", "metadata.jsonl")
+
+# Also write the legacy one-JSON-file-per-PDF layout
+WRITE_JSON_FILES = False
+
+# PHASE 2.5: Mock policy texts used until real PDF text extraction is wired up
+# Continuation lines keep their leading spaces: keywords such as " nz" match the filename line
+MOCK_TEMPLATES = (
+    "Professional Indemnity Insurance Policy\n"
+    "            BIA Accountants\n"
+    "            This policy provides professional liability cover for accountants.\n"
+    "            Professional indemnity insurance with accountant specific covers.\n"
+    "            {filename}",
+
+    "Farm Extra Insurance\n"
+    "            Argis Insurance\n"
+    "            Agricultural and farming insurance policy.\n"
+    "            Covers farm buildings, rural property, and agricultural equipment.\n"
+    "            {filename}",
+
+    "Residential Landlord Policy\n"
+    "            Castle Insurance\n"
+    "            Landlord and rental property insurance.\n"
+    "            Investment property landlord cover for residential properties.\n"
+    "            {filename}",
+
+    "Construction Indemnity Cover\n"
+    "            AMI Building\n"
+    "            Contract works and builders indemnity.\n"
+    "            Construction and building project insurance protection.\n"
+    "            {filename}",
+
+    "Car Insurance – Policy Wording\n"
+    "            AMI Limited\n"
+    "            Motor vehicle insurance policy for New Zealand.\n"
+    "            Car insurance with comprehensive vehicle cover options.\n"
+    "            {filename}",
+)
+
+def process_pdf(task):
+    """
+    Extract text and build the metadata dict for one PDF.
+    Runs in a worker process; task is (file_number, filename).
+    """
+    file_count, filename = task
     
-    for filename in os.listdir(raw_docs_folder):
-        filepath = os.path.join(raw_docs_folder, filename)
-        
+    # PHASE 2.5: Mock text extraction (simulate diverse policy types)
+    # In production, use PyPDF2 or pdfplumber to extract actual text
+    # Rotate through mock texts, formatting only the one in use
+    mock_text = MOCK_TEMPLATES[file_count % len(MOCK_TEMPLATES)].format(filename=filename)
+    
+    # PHASE 2.5: Detect with selective logic (fixes applied)
+    detected = classify(mock_text)
+    country = detected["country"]
+    insurer = detected["insurer"]  # FIX 1: Cover page only
+    line = detected["insurance_line"]  # FIX 2: Priority-ordered detection
+    product = detected["product_name"]  # FIX 3: Title text extraction
+
+    # Determine document type
+    document_type = "Policy Wording" if "Wording" in product else "Policy Document"
+
+    # High confidence if all fields populated
+    is_high_confidence = (country != "Unknown" and insurer != "Unknown" and line != "Unknown")
+    confidence = "High" if is_high_confidence else "Medium"
+
+    # Generate structured filename
+    generated_filename = build_filename({
+        'country': country,
+        'insurer': insurer,
+        'insurance_line': line,
+        'product_name': product
+    })
+
+    # PHASE 2.5: Production-clean metadata structure
+    metadata = {
+        "original_filename": filename,
+        "generated_filename": generated_filename,
+        "country": country,
+        "insurer": insurer,
+        "insurance_line": line,
+        "product_name": product,
+        "document_type": document_type,
+        "source_url": "local_upload",
+        "download_date": today,
+        "confidence": confidence,
+        "status": "needs_review",  # Status lifecycle starts here
+        "created_at": date.today().isoformat()
+    }
+    
+    return metadata
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    
+    # Create metadata folder if it doesn't exist
+    os.makedirs("metadata", exist_ok=True)
+    
+    if not os.path.exists(raw_docs_folder):
+        logger.error("Error: %s folder not found", raw_docs_folder)
+    else:
         # Only process PDF files
-        if not filename.lower().endswith('.pdf') or not os.path.isfile(filepath):
-            continue
+        # scandir caches each entry's file type from the directory read
+        with os.scandir(raw_docs_folder) as entries:
+            pdf_files = [
+                entry.name for entry in entries
+                if entry.name.lower().endswith('.pdf') and entry.is_file()
+            ]
         
-        file_count += 1
+        # Keep records for PDFs that are not re-processed this run (e.g. already organized)
+        previous_records = read_jsonl_records(METADATA_JSONL)
         
-        # PHASE 2.5: Mock text extraction (simulate diverse policy types)
-        # In production, use PyPDF2 or pdfplumber to extract actual text
-        mock_texts = [
-            f"""Professional Indemnity Insurance Policy
-            BIA Accountants
-            This policy provides professional liability cover for accountants.
-            Professional indemnity insurance with accountant specific covers.
-            {filename}""",
-            
-            f"""Farm Extra Insurance
-            Argis Insurance
-            Agricultural and farming insurance policy.
-            Covers farm buildings, rural property, and agricultural equipment.
-            {filename}""",
-            
-            f"""Residential Landlord Policy
-            Castle Insurance
-            Landlord and rental property insurance.
-            Investment property landlord cover for residential properties.
-            {filename}""",
+        # Detection is CPU-bound and independent per file, so fan it out across cores.
+        # Metadata writes stay in this process: one JSONL file opened once, swapped in at the end.
+        partial_jsonl = METADATA_JSONL + ".part"
+        with ProcessPoolExecutor() as executor, open(partial_jsonl, 'wb') as jsonl_file:
+            for metadata in executor.map(process_pdf, enumerate(pdf_files, start=1), chunksize=16):
+                jsonl_file.write(orjson.dumps(metadata) + b"\n")
+                previous_records.pop(metadata["original_filename"], None)
+                
+                if WRITE_JSON_FILES:
+                    # Legacy per-file JSON export
+                    json_filename = os.path.splitext(metadata["original_filename"])[0] + ".json"
+                    write_json(os.path.join("metadata", json_filename), metadata)
+                
+                # One log record per file instead of a print per field
+                logger.info(
+                    "✅ Created: %s\n"
+                    "   ├─ Country: %s\n"
+                    "   ├─ Insurer: %s\n"
+                    "   ├─ Line: %s\n"
+                    "   ├─ Product: %s\n"
+                    "   ├─ Type: %s\n"
+                    "   ├─ Confidence: %s\n"
+                    "   └─ Generated: %s\n",
+                    metadata["original_filename"],
+                    metadata['country'],
+                    metadata['insurer'],
+                    metadata['insurance_line'],
+                    metadata['product_name'],
+                    metadata['document_type'],
+                    metadata['confidence'],
+                    metadata['generated_filename'],
+                )
             
-            f"""Construction Indemnity Cover
-            AMI Building
-            Contract works and builders indemnity.
-            Construction and building project insurance protection.
-            {filename}""",
-            
-            f"""Car Insurance – Policy Wording
-            AMI Limited
-            Motor vehicle insurance policy for New Zealand.
-            Car insurance with comprehensive vehicle cover options.
-            {filename}"""
-        ]
-        
-        # Rotate through mock texts
-        mock_text = mock_texts[file_count % len(mock_texts)]
-        
-        # PHASE 2.5: Detect with selective logic (fixes applied)
-        country = detect_country(mock_text)
-        insurer = detect_insurer(mock_text)  # FIX 1: Top 2000 chars only
-        line = detect_line(mock_text)  # FIX 2: Priority-ordered detection
-        product = detect_product_name(mock_text)  # FIX 3: Title text extraction
-        
-        # Determine document type
-        document_type = "Policy Wording" if "Wording" in product else "Policy Document"
-        
-        # High confidence if all fields populated
-        is_high_confidence = (country != "Unknown" and insurer != "Unknown" and line != "Unknown")
-        confidence = "High" if is_high_confidence else "Medium"
-        
-        # Generate structured filename
-        generated_filename = build_filename({
-            'country': country,
-            'insurer': insurer,
-            'insurance_line': line,
-            'product_name': product
-        })
-        
-        # PHASE 2.5: Production-clean metadata structure
-        metadata = {
-            "original_filename": filename,
-            "generated_filename": generated_filename,
-            "country": country,
-            "insurer": insurer,
-            "insurance_line": line,
-            "product_name": product,
-            "document_type": document_type,
-            "source_url": "local_upload",
-            "download_date": today,
-            "confidence": confidence,
-            "status": "needs_review",  # Status lifecycle starts here
-            "created_at": date.today().isoformat()
-        }
-        
-        # Create JSON filename
-        json_filename = os.path.splitext(filename)[0] + ".json"
-        json_filepath = os.path.join("metadata", json_filename)
-        
-        # Write JSON file
-        with open(json_filepath, 'w') as f:
-            json.dump(metadata, f, indent=2)
+            jsonl_file.writelines(previous_records.values())
         
-        print(f"✅ Created: {json_filename}")
-        print(f"   ├─ Country: {country}")
-        print(f"   ├─ Insurer: {insurer}")
-        print(f"   ├─ Line: {line}")
-        print(f"   ├─ Product: {product}")
-        print(f"   ├─ Type: {document_type}")
-        print(f"   ├─ Confidence: {confidence}")
-        print(f"   └─ Generated: {generated_filename}\n")
+        os.replace(partial_jsonl, METADATA_JSONL)
@@ -1,7 +1,9 @@
 import os
-import requests
+import asyncio
 from urllib.parse import urlparse
 
+import aiohttp
+
 # Create folder if it doesn't exist
 os.makedirs("raw_documents", exist_ok=True)
 
@@ -12,32 +14,79 @@ urls = [
     # "https://example.com/document2.pdf",
 ]
 
-for url in urls:
+# Maximum number of downloads in flight at once
+MAX_CONCURRENT_DOWNLOADS = 16
+
+# Connect and per-read timeouts in seconds (no cap on total transfer time)
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(sock_connect=10, sock_read=10)
+
+# Stream downloads to disk in 1 MiB chunks instead of buffering whole PDFs
+CHUNK_SIZE = 1024 * 1024
+
+def url_to_filename(url):
+    """Derive the raw_documents filename for a URL"""
+    # Extract filename from URL
+    parsed_url = urlparse(url)
+    filename = os.path.basename(parsed_url.path)
+
+    # Add .pdf extension if not present
+    if not filename.endswith('.pdf'):
+        filename += '.pdf'
+
+    return filename
+
+async def fetch(session, url, filename, sem):
+    """
+    Download one URL into raw_documents, sharing the session's keep-alive connections
+    """
     try:
-        # Extract filename from URL
-        parsed_url = urlparse(url)
-        filename = os.path.basename(parsed_url.path)
-        
-        # Add .pdf extension if not present
-        if not filename.endswith('.pdf'):
-            filename += '.pdf'
-        
         filepath = os.path.join("raw_documents", filename)
-        
+
         # Check if file already exists
         if os.path.exists(filepath):
             print(f"Skipped: {filename} (already exists)")
-            continue
-        
-        # Download the file
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        # Save the file
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        
+            return
+
+        # Download to a temporary name so a failed transfer never looks complete
+        partial_filepath = filepath + ".part"
+        try:
+            async with sem, session.get(url, timeout=REQUEST_TIMEOUT) as response:
+                response.raise_for_status()
+                f = await asyncio.to_thread(open, partial_filepath, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        # Write each chunk without blocking the event loop
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+            os.replace(partial_filepath, filepath)
+        except BaseException:
+            if os.path.exists(partial_filepath):
+                os.remove(partial_filepath)
+            raise
+
         print(f"Downloaded: {filename}")
-    
+
     except Exception as e:
         print(f"Error downloading {url}: {e}")
+
+async def main():
+    # Resolve filenames up front: concurrent tasks sharing a filename would write the same file
+    downloads = {}
+    for url in urls:
+        try:
+            filename = url_to_filename(url)
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            continue
+        if filename in downloads:
+            print(f"Skipped: {filename} (same filename as {downloads[filename]})")
+            continue
+        downloads[filename] = url
+
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(fetch(session, url, filename, sem) for filename, url in downloads.items()))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,23 +1,34 @@
 import os
-import json
+import sys
+import logging
 import shutil
 import re
+import functools
 from datetime import datetime
 
+import orjson
+
 # ========== STATUS LIFECYCLE ==========
 # needs_review → classified → organized
 # This ensures proper workflow tracking and audit trail
 # =======================================
 
+# Per-file progress goes through one log record per event
+logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+logger = logging.getLogger(__name__)
+
 # Folders
 raw_docs_folder = "raw_documents"
 metadata_folder = "metadata"
+metadata_jsonl = os.path.join(metadata_folder, "metadata.jsonl")
 policies_folder = "policies"
 
 # Create policies folder if it doesn't exist
 os.makedirs(policies_folder, exist_ok=True)
 
 # PHASE 2: Safe Text Cleaning Function
+_CLEAN_RE = re.compile(r'[^A-Za-z0-9_-]')
+
 def clean_text(value):
     """
     Safe text cleaning for filenames and folder names
@@ -27,10 +38,16 @@ def clean_text(value):
     """
     if not value:
         return "Unknown"
-    value = str(value).strip()
+    # Convert first so any JSON value (lists included) can hit the cache
+    return _clean_str(str(value))
+
+@functools.lru_cache(maxsize=4096)
+def _clean_str(value):
+    """Cached cleaning of an already-stringified value"""
+    value = value.strip()
     value = value.replace(' ', '_')
     # Remove any character that's not alphanumeric, underscore, or hyphen
-    value = re.sub(r'[^A-Za-z0-9_-]', '', value)
+    value = _CLEAN_RE.sub('', value)
     return value if value else "Unknown"
 
 # PHASE 2: Helper functions
@@ -46,40 +63,101 @@ def build_filename(metadata):
     
     return f"{country}_{insurer}_{line}_{product}.pdf"
 
+def write_json(filepath, data):
+    """
+    Serialize data with orjson and write the bytes straight to a file descriptor
+    """
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def write_jsonl(filepath, lines):
+    """
+    Replace a JSONL file in one step so a failed write never leaves it half-written
+    """
+    partial_filepath = filepath + ".part"
+    with open(partial_filepath, 'wb') as f:
+        f.writelines(lines)
+    os.replace(partial_filepath, filepath)
+
 # Check if metadata folder exists
 if not os.path.exists(metadata_folder):
-    print(f"Error: {metadata_folder} folder not found")
+    logger.error("Error: %s folder not found", metadata_folder)
 else:
     organized_count = 0
     skipped_count = 0
     total_size = 0
+    created_dirs = set()  # Folders already made this run, so makedirs is not repeated
 
-    # Process each metadata file
-    for filename in os.listdir(metadata_folder):
-        if not filename.lower().endswith('.json'):
-            continue
+    # Metadata records come from metadata.jsonl, or legacy per-file JSON if it is absent.
+    # Sources are listed up front, since the loop rewrites metadata as it goes.
+    if os.path.exists(metadata_jsonl):
+        with open(metadata_jsonl, 'rb') as f:
+            jsonl_lines = f.readlines()
+        ends_with_newline = not jsonl_lines or jsonl_lines[-1].endswith(b"\n")
+        
+        # Status updates are appended as they happen, so the last line per PDF wins
+        latest_lines = {}
+        for index, line in enumerate(jsonl_lines):
+            if not line.strip():
+                continue
+            try:
+                key = orjson.loads(line).get("original_filename")
+            except (orjson.JSONDecodeError, AttributeError):
+                key = None
+            latest_lines[key or index] = index
+        kept_indexes = sorted(latest_lines.values())
+        jsonl_dirty = len(kept_indexes) != len(jsonl_lines)  # Superseded or blank lines to compact
         
-        metadata_filepath = os.path.join(metadata_folder, filename)
+        metadata_sources = [
+            (f"{os.path.basename(metadata_jsonl)} line {index + 1}", index)
+            for index in kept_indexes
+        ]
         
+        # Each organized PDF's new status is appended straight after its move
+        jsonl_journal = open(metadata_jsonl, 'ab')
+        if not ends_with_newline:
+            jsonl_journal.write(b"\n")
+    else:
+        jsonl_lines = None
+        with os.scandir(metadata_folder) as entries:
+            metadata_sources = [
+                (entry.name, entry.path) for entry in entries
+                if entry.name.lower().endswith('.json') and entry.is_file()
+            ]
+    
+    jsonl_stems = set()  # Records seen in metadata.jsonl, to spot legacy files it lacks
+    
+    for filename, metadata_location in metadata_sources:
         # Read metadata
         try:
-            with open(metadata_filepath, 'r') as f:
-                metadata = json.load(f)
+            if jsonl_lines is None:
+                with open(metadata_location, 'rb') as f:
+                    metadata = orjson.loads(f.read())
+            else:
+                metadata = orjson.loads(jsonl_lines[metadata_location])
         except Exception as e:
-            print(f"❌ Error reading {filename}: {e}")
+            logger.error("❌ Error reading %s: %s", filename, e)
             continue
         
         # PHASE 2: Safety check - ensure original_filename exists
         original_filename = metadata.get("original_filename")
         if not original_filename:
-            print(f"❌ Missing original_filename in metadata: {filename}")
+            logger.error("❌ Missing original_filename in metadata: %s", filename)
             skipped_count += 1
             continue
         
+        jsonl_stems.add(os.path.splitext(original_filename)[0])
+        
         # Status lifecycle check: needs_review → classified → organized
         status = metadata.get("status", "unknown")
         if status != "classified":
-            print(f"⏭️  Skipped: {original_filename} (status: {status})")
+            logger.info("⏭️  Skipped: %s (status: %s)", original_filename, status)
             skipped_count += 1
             continue
         
@@ -89,7 +167,7 @@ else:
         
         for field in required_fields:
             if metadata.get(field) == "Unknown":
-                print(f"⏭️  Skipped: {original_filename} ({field} is 'Unknown')")
+                logger.info("⏭️  Skipped: %s (%s is 'Unknown')", original_filename, field)
                 has_unknown = True
                 skipped_count += 1
                 break
@@ -113,9 +191,11 @@ else:
         
         # Create folder structure
         try:
-            os.makedirs(folder_path, exist_ok=True)
+            if folder_path not in created_dirs:
+                os.makedirs(folder_path, exist_ok=True)
+                created_dirs.add(folder_path)
         except Exception as e:
-            print(f"❌ Error creating folder {folder_path}: {e}")
+            logger.error("❌ Error creating folder %s: %s", folder_path, e)
             skipped_count += 1
             continue
         
@@ -126,16 +206,19 @@ else:
         dst_filepath = os.path.join(folder_path, generated_filename)
         
         try:
-            if os.path.exists(src_filepath):
+            try:
                 file_size = os.path.getsize(src_filepath)
-                shutil.move(src_filepath, dst_filepath)
+            except FileNotFoundError:
+                file_size = None
+            
+            if file_size is not None:
+                # Same-filesystem rename is one atomic syscall; fall back to copy across devices
+                try:
+                    os.replace(src_filepath, dst_filepath)
+                except OSError:
+                    shutil.move(src_filepath, dst_filepath)
                 total_size += file_size
                 
-                print(f"✅ Organized: {original_filename}")
-                print(f"   ├─ Renamed to: {generated_filename}")
-                print(f"   ├─ Type: {metadata.get('document_type', 'Unknown')}")
-                print(f"   ├─ Confidence: {metadata.get('confidence', 'Unknown')}")
-                print(f"   └─ Location: {folder_path}/")
                 organized_count += 1
                 
                 # PHASE 2: Update metadata with final status and ISO date format
@@ -143,26 +226,84 @@ else:
                 metadata["status"] = "organized"
                 metadata["organized_date"] = datetime.now().isoformat()
                 
-                with open(metadata_filepath, 'w') as f:
-                    json.dump(metadata, f, indent=2)
+                if jsonl_lines is None:
+                    write_json(metadata_location, metadata)
+                else:
+                    jsonl_lines[metadata_location] = orjson.dumps(metadata) + b"\n"
+                    jsonl_journal.write(jsonl_lines[metadata_location])
+                    jsonl_journal.flush()
+                    jsonl_dirty = True
+                    
+                    # Keep the legacy per-file JSON (WRITE_JSON_FILES) in step
+                    legacy_filepath = os.path.join(
+                        metadata_folder, os.path.splitext(original_filename)[0] + ".json"
+                    )
+                    if os.path.exists(legacy_filepath):
+                        write_json(legacy_filepath, metadata)
                 
-                print(f"   📝 Metadata updated (status: organized)\n")
+                logger.info(
+                    "✅ Organized: %s\n"
+                    "   ├─ Renamed to: %s\n"
+                    "   ├─ Type: %s\n"
+                    "   ├─ Confidence: %s\n"
+                    "   └─ Location: %s/\n"
+                    "   📝 Metadata updated (status: organized)\n",
+                    original_filename,
+                    generated_filename,
+                    metadata.get('document_type', 'Unknown'),
+                    metadata.get('confidence', 'Unknown'),
+                    folder_path,
+                )
                 
             else:
-                print(f"❌ Error: {original_filename} (PDF file not found in {raw_docs_folder})")
+                logger.error("❌ Error: %s (PDF file not found in %s)", original_filename, raw_docs_folder)
                 skipped_count += 1
         except Exception as e:
-            print(f"❌ Error organizing {original_filename}: {e}")
+            logger.error("❌ Error organizing %s: %s", original_filename, e)
             skipped_count += 1
 
+    # Compact metadata.jsonl to one line per PDF (an interrupted run leaves the appended updates)
+    if jsonl_lines is not None:
+        jsonl_journal.close()
+        if jsonl_dirty:
+            write_jsonl(metadata_jsonl, [
+                line if line.endswith(b"\n") else line + b"\n"
+                for line in (jsonl_lines[index] for index in kept_indexes)
+            ])
+
+    # Legacy per-file JSON is not read once metadata.jsonl exists; flag records only found there
+    if jsonl_lines is not None:
+        with os.scandir(metadata_folder) as entries:
+            ignored = sorted(
+                entry.name for entry in entries
+                if entry.name.lower().endswith('.json') and entry.is_file()
+                and os.path.splitext(entry.name)[0] not in jsonl_stems
+            )
+        if ignored:
+            logger.warning(
+                "⚠️  Ignored %d legacy metadata files missing from %s: %s",
+                len(ignored),
+                os.path.basename(metadata_jsonl),
+                ", ".join(ignored),
+            )
+
     # PHASE 2: Production summary
-    print("\n" + "="*60)
-    print("📊 PHASE 2 ORGANIZATION SUMMARY")
-    print("="*60)
-    print(f"✅ Organized: {organized_count} files")
-    print(f"⏭️  Skipped: {skipped_count} files")
-    print(f"📦 Total Size: {total_size / (1024*1024):.2f} MB")
-    print(f"📁 Base Path: {policies_folder}/")
-    print(f"🔄 Status Lifecycle: needs_review → classified → organized")
-    print("="*60 + "\n")
+    logger.info(
+        "\n%s\n"
+        "📊 PHASE 2 ORGANIZATION SUMMARY\n"
+        "%s\n"
+        "✅ Organized: %d files\n"
+        "⏭️  Skipped: %d files\n"
+        "📦 Total Size: %.2f MB\n"
+        "📁 Base Path: %s/\n"
+        "🔄 Status Lifecycle: needs_review → classified → organized\n"
+        "%s\n",
+        "="*60,
+        "="*60,
+        organized_count,
+        skipped_count,
+        total_size / (1024*1024),
+        policies_folder,
+        "="*60,
+    )
 